@@ -1,20 +1,32 @@
 import argparse
+import os
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum, auto
+from functools import lru_cache
 
-import msgpack
 import numpy as np
 from udacidrone import Drone
 from udacidrone.connection import MavlinkConnection
 from udacidrone.frame_utils import global_to_local, local_to_global
 from udacidrone.messaging import MsgID
 
-from planning_utils import create_grid, a_star, path_prune, heuristic, pickup_goal, \
-collinear_points, path_simplify, convert_25d_3d
+from planning_utils import create_grid, a_star, heuristic, pickup_goal, \
+los_simplify, convert_25d_3d, compute_clearance
 
 TARGET_ALTITUDE = 5
 SAFETY_DISTANCE = 5
 
+
+@lru_cache(maxsize=8)
+def cached_global_to_local(position, home):
+    """
+    Memoized WGS84 -> local conversion for fixed points. Replans reuse
+    the same goal and home, so the geodetic math runs only once per pair.
+    """
+    return global_to_local(position, home)
+
 class States(Enum):
     MANUAL = auto()
     ARMING = auto()
@@ -26,11 +38,21 @@ class States(Enum):
 
 class MotionPlanning(Drone):
 
+    # the obstacle map is static, so the parsed colliders data and the
+    # rasterized grid are cached across replans (shared by all instances)
+    _cached_colliders_mtime = None
+    _cached_data = None
+    _cached_grid_tuple = None
+    _cached_clearance = None
+    _cached_home = None
+
     def __init__(self, connection):
         super().__init__(connection)
 
-        self.target_position = np.array([0.0, 0.0, 0.0])
-        self.waypoints = []
+        # plain tuple of floats: the callbacks index it at telemetry rate,
+        # and tiny-ndarray slicing would allocate on every tick
+        self.target_position = (0.0, 0.0, 0.0, 0.0)
+        self.waypoints = deque()
         self.in_mission = True
         self.check_state = {}
 
@@ -38,10 +60,16 @@ class MotionPlanning(Drone):
         self.temporary_scatter = None
         self.previous_location = None
         self.map_grid = None
+        self.clearance = None
         self.north_offset = None
         self.east_offset = None
         self.path = None
 
+        # the planner runs on this worker so the message pump keeps
+        # draining telemetry while a search is in progress
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._planner_future = None
+
         # initial state
         self.flight_state = States.MANUAL
 
@@ -50,17 +78,34 @@ class MotionPlanning(Drone):
         self.register_callback(MsgID.LOCAL_VELOCITY, self.velocity_callback)
         self.register_callback(MsgID.STATE, self.state_callback)
 
+    def check_planning_done(self):
+        # take off once the background planner has delivered the mission;
+        # result() re-raises anything the worker failed with
+        if self._planner_future is not None and self._planner_future.done():
+            future = self._planner_future
+            self._planner_future = None
+            future.result()
+            self.takeoff_transition()
+
     def local_position_callback(self):
-        if self.flight_state == States.TAKEOFF:
+        if self.flight_state == States.PLANNING:
+            self.check_planning_done()
+        elif self.flight_state == States.TAKEOFF:
             if -1.0 * self.local_position[2] > 0.95 * self.target_position[2]:
                 self.waypoint_transition()
         elif self.flight_state == States.WAYPOINT:
-            if np.linalg.norm(self.target_position[0:2] - self.local_position[0:2]) < 3.0 \
-                    and abs(self.target_position[2] - (-self.local_position[2])) < 2.0:
+            # this fires on every LOCAL_POSITION message, so compare squared
+            # distances with scalar math instead of allocating slices and
+            # calling np.linalg.norm twice per tick
+            dn = self.target_position[0] - self.local_position[0]
+            de = self.target_position[1] - self.local_position[1]
+            if dn * dn + de * de < 9.0 and abs(self.target_position[2] + self.local_position[2]) < 2.0:
                 if len(self.waypoints) > 0:
                     self.waypoint_transition()
                 else:
-                    if np.linalg.norm(self.local_velocity[0:2]) < 1.0:
+                    vn = self.local_velocity[0]
+                    ve = self.local_velocity[1]
+                    if vn * vn + ve * ve < 1.0:
                         self.landing_transition()
 
     def velocity_callback(self):
@@ -77,7 +122,7 @@ class MotionPlanning(Drone):
                 if self.armed:
                     self.plan_path()
             elif self.flight_state == States.PLANNING:
-                self.takeoff_transition()
+                self.check_planning_done()
             elif self.flight_state == States.DISARMING:
                 if ~self.armed & ~self.guided:
                     self.manual_transition()
@@ -97,7 +142,7 @@ class MotionPlanning(Drone):
         self.flight_state = States.WAYPOINT
         print("waypoint transition")
         print(self.waypoints)
-        self.target_position = self.waypoints.pop(0)
+        self.target_position = tuple(self.waypoints.popleft())
         print('target position', self.target_position)
         self.cmd_position(self.target_position[0], self.target_position[1], self.target_position[2],
                         self.target_position[3])
@@ -121,7 +166,11 @@ class MotionPlanning(Drone):
 
     def send_waypoints(self):
         print("Sending waypoints to simulator ...")
-        data = msgpack.dumps(self.waypoints)
+        # serialize the whole mission as one contiguous float32 blob with a
+        # little-endian count prefix: no per-element introspection and a
+        # single write for the entire payload
+        buf = np.ascontiguousarray(list(self.waypoints), dtype='<f4')
+        data = len(self.waypoints).to_bytes(4, 'little') + buf.tobytes()
         self.connection._master.write(data)
 
     def pick_goal(self, event):
@@ -150,18 +199,58 @@ class MotionPlanning(Drone):
         alt = int(-position[2])
         return north, east, alt
 
+    def load_grid(self, filename='colliders.csv'):
+        # rebuilding the grid is expensive and the obstacle map never changes,
+        # so reuse the in-memory copy (or the .npz sidecar on a cold start)
+        # as long as the csv has not been modified
+        cls = MotionPlanning
+        mtime = os.stat(filename).st_mtime
+        if cls._cached_grid_tuple is not None and cls._cached_colliders_mtime == mtime:
+            return cls._cached_grid_tuple
+
+        sidecar = 'colliders.grid.npz'
+        use_sidecar = os.path.isfile(sidecar) and os.stat(sidecar).st_mtime >= mtime
+
+        # single pass over the csv: the home position comes off the open
+        # handle and np.loadtxt consumes the rest of it (skipping only the
+        # column-name row), instead of opening the file a second time
+        with open(filename, 'r') as f:
+            lat_str, lon_str = f.readline().split(',')
+            lat = float(lat_str.strip().split(' ')[1])
+            lon = float(lon_str.strip().split(' ')[1])
+            if not use_sidecar:
+                data = np.loadtxt(f, delimiter=',', dtype='float64', skiprows=1)
+
+        if use_sidecar:
+            cached = np.load(sidecar)
+            grid = cached['grid']
+            north_offset, east_offset = (int(v) for v in cached['offsets'])
+        else:
+            cls._cached_data = data
+            grid, north_offset, east_offset = create_grid(data, SAFETY_DISTANCE)
+            # write the sidecar atomically: a crash mid-write must not leave
+            # a corrupt cache that later cold starts trust on mtime alone
+            with open(sidecar + '.tmp', 'wb') as f:
+                np.savez_compressed(f, grid=grid, offsets=np.array([north_offset, east_offset]))
+            os.replace(sidecar + '.tmp', sidecar)
+
+        cls._cached_home = (lat, lon)
+        cls._cached_colliders_mtime = mtime
+        cls._cached_grid_tuple = (grid, north_offset, east_offset)
+        cls._cached_clearance = compute_clearance(grid, TARGET_ALTITUDE)
+        return cls._cached_grid_tuple
+
     def plan_path(self):
         self.flight_state = States.PLANNING
-        print("Searching path...")
-
-        self.target_position[2] = TARGET_ALTITUDE
+        self.target_position = (0.0, 0.0, float(TARGET_ALTITUDE), 0.0)
 
-        with open('colliders.csv', 'r') as f:
-            header_line = f.readline()
-            lat_str, lon_str = header_line.split(',')
-            lat = float(lat_str.strip().split(' ')[1])
-            lon = float(lon_str.strip().split(' ')[1])
-            print("Map home location: ({}, {})".format(lat, lon))
+        # Read in the obstacle map and rasterize it to a grid for a particular
+        # altitude and safety margin (cached, only done once per map); the
+        # same pass yields the map home position from the header line
+        grid, north_offset, east_offset = self.load_grid('colliders.csv')
+        self.clearance = MotionPlanning._cached_clearance
+        lat, lon = MotionPlanning._cached_home
+        print("Map home location: ({}, {})".format(lat, lon))
 
         home_position = (lon, lat, 0)
         self.set_home_position(*home_position)
@@ -172,11 +261,6 @@ class MotionPlanning(Drone):
 
         print('global home {0}, position {1}, local position {2}'.format(self.global_home, self.global_position,
                                                                         self.local_position))
-        # Read in obstacle map
-        data = np.loadtxt('colliders.csv', delimiter=',', dtype='Float64', skiprows=2)
-
-        # Define a grid for a particular altitude and safety margin around obstacles
-        grid, north_offset, east_offset = create_grid(data, SAFETY_DISTANCE)
         self.map_grid = grid
         self.north_offset = north_offset
         self.east_offset = east_offset
@@ -187,13 +271,15 @@ class MotionPlanning(Drone):
         alt_start = int(max(TARGET_ALTITUDE, grid_start[2] + 1, grid[grid_start[0], grid_start[1]] + 1))
         grid_start = grid_start[0], grid_start[1], alt_start
 
-        # visualize grid: interavtive goal pick up
+        # visualize grid: interavtive goal pick up; the matplotlib window
+        # cannot run on the executor worker, so the goal is picked here
+        # before the search is handed off
         self.temporary_scatter = pickup_goal(grid, grid_start, self.pick_goal)
 
-        goal = self.interactive_goal
+        goal = tuple(self.interactive_goal)
         if len(goal) < 3:
             goal = (goal[0], goal[1], 0)
-        goal_local = global_to_local(goal, self.global_home)
+        goal_local = cached_global_to_local(goal, tuple(self.global_home))
         goal_grid = self.local_to_grid(goal_local)
         goal_north, goal_east, goal_alt = goal_grid
         grid_goal = (goal_north,
@@ -202,28 +288,38 @@ class MotionPlanning(Drone):
 
         print('Start and Goal location', grid_start, grid_goal)
         print("Searching path...")
-        path = a_star(grid, heuristic, grid_start, grid_goal, TARGET_ALTITUDE)
-        path = path_prune(path, collinear_points)
-        print("3D Pruned Path:", path)
-        path = path_simplify(grid, path)
+        # hand the heavy search to the worker thread; the jitted kernels
+        # release the GIL, so telemetry callbacks keep running meanwhile
+        self._planner_future = self._executor.submit(
+            self.plan_path_worker, grid, grid_start, grid_goal)
+
+    def plan_path_worker(self, grid, grid_start, grid_goal):
+        path = a_star(grid, heuristic, grid_start, grid_goal, TARGET_ALTITUDE, bidirectional=True,
+                      clearance=self.clearance)
+        # one line-of-sight sweep both prunes collinear runs and pulls the
+        # path onto the farthest directly-visible waypoints
+        path = los_simplify(grid, path, self.clearance)
         print("Path found!")
         print(path)
         self.path = path
         waypoints = self.path_to_waypoints(path)
-        self.waypoints = waypoints
+        # deque: waypoint_transition consumes from the front, which is O(N)
+        # per pop on a list but O(1) here
+        self.waypoints = deque(waypoints)
         self.send_waypoints()
 
     def path_to_waypoints(self, path):
-        # Convert path to waypoints
-        waypoints = []
-        for i in range(len(path)):
-            p = path[i]
-            p_prev = path[i - 1] if i > 0 else None
-            orientation = 0
-            if p_prev is not None:
-                orientation = np.arctan2(p[1] - p_prev[1], p[0] - p_prev[0])
-            waypoints.append([p[0] + self.north_offset, p[1] + self.east_offset, p[2], orientation])
-        return waypoints
+        # Convert path to waypoints in one vectorized pass: the heading of each
+        # waypoint points along the segment leading into it (0 for the first)
+        p = np.asarray(path, dtype=np.float64)
+        deltas = np.diff(p[:, :2], axis=0, prepend=p[:1, :2])
+        orientations = np.arctan2(deltas[:, 1], deltas[:, 0])
+        orientations[0] = 0.0
+        waypoints = np.column_stack([p[:, 0] + self.north_offset,
+                                     p[:, 1] + self.east_offset,
+                                     p[:, 2],
+                                     orientations]).astype(np.float32)
+        return waypoints.tolist()
 
     def start(self):
         self.start_log("Logs", "NavLog.txt")
@@ -1,12 +1,35 @@
 from enum import Enum
-from queue import PriorityQueue
 import numpy as np
-import operator as op
 import time
-from enum import Enum
-from queue import PriorityQueue
 import matplotlib.pyplot as plt
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    # numba is optional: without it the decorated helpers run as plain
+    # Python over the same numpy arrays
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+
+        def decorate(fn):
+            return fn
+        return decorate
+
+try:
+    from scipy.ndimage import distance_transform_edt
+except ImportError:
+    # scipy is optional: without it no clearance field is built and the
+    # planner falls back to plain per-cell height checks
+    distance_transform_edt = None
+
+# sentinel passed to the jitted expansion loop when no clearance field
+# is available (numba cannot take None for an array argument)
+NO_CLEARANCE = np.empty((0, 0), dtype=np.float32)
+
 class Action(Enum):
     """
     Actions when doing 2.5D A* search.
@@ -62,6 +85,18 @@ def create_grid(data, safe_distance):
     return grid, int(north_min), int(east_min)
 
 
+def compute_clearance(grid, flight_altitude):
+    """
+    Distance (in cells) from every cell to the nearest cell that is an
+    obstacle at the given flight altitude. One distance transform per
+    grid replaces per-cell height comparisons during search and
+    line-of-sight checks. Returns None when scipy is not available.
+    """
+    if distance_transform_edt is None:
+        return None
+    return distance_transform_edt(grid < flight_altitude).astype(np.float32)
+
+
 def heuristic(position, goal):
     """
     Returns the eucledian distance between 2 points.
@@ -94,7 +129,8 @@ def valid_actions(grid, current_node):
 
 def reconstruct_path(goal, branch, waypoint_fn):
     """
-    Reconstruct a path from the goal state and branch information
+    Reconstruct a path from the goal state and branch information.
+    Returns a contiguous (N, 3) int32 array of grid coordinates.
     """
     current_node = goal
     path = [current_node]
@@ -104,34 +140,34 @@ def reconstruct_path(goal, branch, waypoint_fn):
         current_node = previous_node
     path.pop()
     path.reverse()
-    return path
+    return np.array(path, dtype=np.int32)
 
 def collinear_points(p1, p2, p3):
     """
-    Check collinearity by using vector cross product
+    Check collinearity of three path points (rows of the path array) via
+    the component determinants of the spanned vectors, without building
+    intermediate arrays
     """
-    return np.allclose(np.cross(np.array(p1) - np.array(p2), np.array(p2) - np.array(p3)), (0, 0, 0))
+    u0, u1, u2 = p2[0] - p1[0], p2[1] - p1[1], p2[2] - p1[2]
+    v0, v1, v2 = p3[0] - p1[0], p3[1] - p1[1], p3[2] - p1[2]
+    return u0 * v1 - u1 * v0 == 0 and u1 * v2 - u2 * v1 == 0 and u0 * v2 - u2 * v0 == 0
 
 
-def path_prune(path, collinear_fn):
+def path_prune(path):
     """
-    prune the path, i.e. remove unnecessary waypoints that are collinear to each other
+    prune the path, i.e. remove interior waypoints that are collinear
+    with their neighbours. The cross products of all interior triples are
+    computed in one vectorized pass instead of one Python call per node;
+    the endpoints are always retained.
     """
-    if len(path) <= 1:
-        return path[:]
-    new_path = [path[0]]
-    line_start = path[0]
-    line_end = path[1]
-    for i in range(2, len(path)):
-        next_end = path[i]
-        if collinear_fn(line_start, line_end, next_end):
-            line_end = next_end
-        else:
-            new_path.append(line_end)
-            line_start = line_end
-            line_end = next_end
-    new_path.append(line_end)
-    return new_path
+    path = np.asarray(path)
+    if len(path) <= 2:
+        return path.copy()
+    u = (path[1:-1] - path[:-2]).astype(np.int64)
+    v = (path[2:] - path[1:-1]).astype(np.int64)
+    bent = np.abs(np.cross(u, v)).max(axis=1) > 0
+    keep = np.concatenate(([0], np.flatnonzero(bent) + 1, [len(path) - 1]))
+    return path[keep]
 
 
 def local_path_to_global_path(path, start_local, north_span, east_span, altitude_span):
@@ -139,41 +175,413 @@ def local_path_to_global_path(path, start_local, north_span, east_span, altitude
     north_min = max(center_n - north_span, 0)
     east_min = max(center_e - east_span, 0)
     alt_min = max(center_a - altitude_span, 0)
-    return [(n + north_min, e + east_min, a + alt_min) for n, e, a in path]
+    return np.asarray(path) + np.array([north_min, east_min, alt_min])
+
+
+# how each action alters the (north, east) location; mirrors the Action
+# enum but in a form the jitted expansion loop can index directly
+ACTION_DELTAS = np.array([[0, -4], [0, 4], [-4, 0], [4, 0]], dtype=np.int64)
+
+
+@njit(cache=True, nogil=True, boundscheck=False)
+def _expand_node(grid, clearance, n, e, alt, goal_n, goal_e, goal_alt, flight_altitude, deltas, out_coords, out_costs):
+    """
+    Expand one search node. Fills out_coords with the in-bounds neighbour
+    (north, east, altitude) triples and out_costs with the full priority
+    increment (move cost + altitude cost + heuristic to the goal), and
+    returns how many neighbours were produced. Everything is inlined
+    scalar math so numba compiles it to a tight loop. When a clearance
+    field is supplied, cells that are clear at the flight altitude skip
+    the height arithmetic entirely.
+    """
+    north_max = grid.shape[0] - 1
+    east_max = grid.shape[1] - 1
+    use_clearance = clearance.shape[0] != 0
+    count = 0
+    for i in range(deltas.shape[0]):
+        nn = n + deltas[i, 0]
+        ne = e + deltas[i, 1]
+        if nn < 0 or nn > north_max or ne < 0 or ne > east_max:
+            continue
+        if use_clearance and clearance[nn, ne] >= 1.0:
+            # clear at the flight altitude: grid heights here are below
+            # the flying slab, so the generic path reduces to this
+            altitude_cost = 0.0
+            lowest_alt = flight_altitude
+        else:
+            height = grid[nn, ne]
+            # altitude cost: going up will always cost more
+            altitude_cost = max(height - alt, 0) * 50
+            lowest_alt = int(np.ceil(max(np.ceil(height) + 1.0, float(flight_altitude))))
+        dn = nn - goal_n
+        de = ne - goal_e
+        da = lowest_alt - goal_alt
+        out_coords[count, 0] = nn
+        out_coords[count, 1] = ne
+        out_coords[count, 2] = lowest_alt
+        out_costs[count] = 4.0 + altitude_cost + np.sqrt(dn * dn + de * de + da * da)
+        count += 1
+    return count
+
+
+# how many same-priority frontier nodes are expanded per round
+BATCH_SIZE = 64
+
+
+def _prefetch_frontier(grid, clearance, pending, deltas):
+    """
+    Speculatively touch the grid and clearance cells the next round of
+    expansions will read. One vectorized gather pulls the cache lines in
+    ahead of the scalar expansion loop; nothing is stored, since the
+    arrays themselves are already O(1) to read when the round arrives.
+    """
+    # for small rounds the gather costs more than the cache misses it hides
+    if len(pending) < 16:
+        return
+    centers = np.array([entry[1][:2] for entry in pending], dtype=np.int64)
+    cells = (centers[:, None, :] + deltas[None, :, :]).reshape(-1, 2)
+    np.clip(cells[:, 0], 0, grid.shape[0] - 1, out=cells[:, 0])
+    np.clip(cells[:, 1], 0, grid.shape[1] - 1, out=cells[:, 1])
+    grid[cells[:, 0], cells[:, 1]]
+    if clearance.shape[0] != 0:
+        clearance[cells[:, 0], cells[:, 1]]
+
+
+@njit(cache=True, nogil=True, boundscheck=False)
+def _expand_batch(grid, clearance, nodes, goal_n, goal_e, goal_alt, flight_altitude, deltas,
+                  out_coords, out_costs, out_parents):
+    """
+    Expand a whole batch of frontier nodes in one call (PA*SE-style
+    frontier parallelism, done as data parallelism: nodes that share the
+    lowest quantized priority are order-independent, so their neighbour
+    generation can run as one fused loop). out_parents records which
+    batch row produced each neighbour.
+    """
+    total = 0
+    for k in range(nodes.shape[0]):
+        produced = _expand_node(grid, clearance, nodes[k, 0], nodes[k, 1], nodes[k, 2],
+                                goal_n, goal_e, goal_alt, flight_altitude, deltas,
+                                out_coords[total:], out_costs[total:])
+        for i in range(produced):
+            out_parents[total + i] = k
+        total += produced
+    return total
+
+
+class CellBitmap:
+    """
+    Packed visited set over 2D grid cells: one bit per cell instead of a
+    Python set of tuples, so membership is a flat-array index with no
+    hashing and the whole closed set of the SF map fits in ~100 KB.
+    """
 
+    def __init__(self, shape):
+        self.height = shape[0]
+        self.width = shape[1]
+        self.bits = bytearray((shape[0] * shape[1] + 7) // 8)
+
+    def test_and_set(self, n, e):
+        """
+        Mark the cell as visited; returns True when it already was.
+        """
+        key = n * self.width + e
+        mask = 1 << (key & 7)
+        if self.bits[key >> 3] & mask:
+            return True
+        self.bits[key >> 3] |= mask
+        return False
+
+    def test(self, n, e):
+        if n < 0 or e < 0 or n >= self.height or e >= self.width:
+            return False
+        key = n * self.width + e
+        return self.bits[key >> 3] & (1 << (key & 7)) != 0
+
+
+class BucketQueue:
+    """
+    Dial-style priority queue. Priorities are quantized to integers and
+    entries kept in per-priority buckets, so put and get are plain list
+    appends/pops instead of O(log N) heap operations with tuple compares.
+    """
 
-def a_star(grid, h, start, goal, flight_altitude, waypoint_fn=lambda n: tuple(n[:2])):
+    def __init__(self):
+        self.buckets = []
+        self.cursor = 0
+        self.size = 0
+
+    def put(self, item):
+        f = int(item[0])
+        if f >= len(self.buckets):
+            self.buckets.extend([] for _ in range(f - len(self.buckets) + 1))
+        self.buckets[f].append(item)
+        if f < self.cursor:
+            self.cursor = f
+        self.size += 1
+
+    def get(self):
+        while not self.buckets[self.cursor]:
+            self.cursor += 1
+        self.size -= 1
+        return self.buckets[self.cursor].pop()
+
+    def get_bucket(self, limit):
+        """
+        Pop up to limit entries sharing the current lowest priority.
+        """
+        while not self.buckets[self.cursor]:
+            self.cursor += 1
+        bucket = self.buckets[self.cursor]
+        if len(bucket) <= limit:
+            self.buckets[self.cursor] = []
+            self.size -= len(bucket)
+            return bucket
+        taken = bucket[-limit:]
+        del bucket[-limit:]
+        self.size -= limit
+        return taken
+
+    def peek_pending(self, limit):
+        """
+        Return up to limit entries at the current lowest priority
+        without popping them.
+        """
+        if self.size == 0:
+            return []
+        while not self.buckets[self.cursor]:
+            self.cursor += 1
+        return self.buckets[self.cursor][-limit:]
+
+    def peek_priority(self):
+        while not self.buckets[self.cursor]:
+            self.cursor += 1
+        return self.cursor
+
+    def empty(self):
+        return self.size == 0
+
+
+# 8-connected planar moves with precomputed unit steps and costs, same
+# 4-cell stride as the Action set
+PLANAR_MOVES = [(dn, de, dn // 4, de // 4, float(np.hypot(dn, de)))
+                for dn in (-4, 0, 4) for de in (-4, 0, 4) if dn or de]
+
+# pre-baked obstacle slab per (grid, altitude); the grid is pinned in the
+# value so a recycled id cannot alias a stale entry
+_slab_cache = {}
+
+
+def _planar_slab(grid, flight_altitude):
+    """
+    Boolean mask of the cells that are obstacles at the flying altitude,
+    baked once per (grid, altitude) pair.
     """
-    2.5D A* search
+    key = (id(grid), flight_altitude)
+    entry = _slab_cache.get(key)
+    if entry is None:
+        _slab_cache.clear()
+        entry = (grid, grid >= flight_altitude)
+        _slab_cache[key] = entry
+    return entry[1]
+
+
+def _planar_search(slab, start, goal, flight_altitude):
+    """
+    8-connected search on the obstacle slab at the flying altitude: the
+    drone mostly flies a constant-altitude slab, so a 2D search with a
+    boolean occupancy test per neighbour usually suffices. Returns
+    (cost, (N, 3) path) or None when an endpoint is blocked at the slab
+    or no route exists; the caller then falls back to the 2.5D search.
+    """
+    start_2d = (int(start[0]), int(start[1]))
+    goal_2d = (int(goal[0]), int(goal[1]))
+    if slab[start_2d] or slab[goal_2d]:
+        return None
+
+    north_max, east_max = slab.shape[0] - 1, slab.shape[1] - 1
+    queue = BucketQueue()
+    visited = CellBitmap(slab.shape)
+    branch = {start_2d: None}
+    queue.put((0.0, start_2d))
+    visited.test_and_set(start_2d[0], start_2d[1])
+
+    while not queue.empty():
+        current_cost, current = queue.get()
+        for dn, de, un, ue, step_cost in PLANAR_MOVES:
+            nn = current[0] + dn
+            ne = current[1] + de
+            if nn < 0 or nn > north_max or ne < 0 or ne > east_max:
+                continue
+            if slab[nn, ne]:
+                continue
+            if un and ue:
+                # a diagonal stride can clip the corner of an inflated
+                # obstacle that covers only cells between the endpoints,
+                # so test the three intermediate cells too; cardinal
+                # strides are covered by the safety-distance inflation.
+                # Checked before the visited bit so a clipped diagonal
+                # does not poison the cell for a later cardinal route.
+                if (slab[current[0] + un, current[1] + ue]
+                        or slab[current[0] + 2 * un, current[1] + 2 * ue]
+                        or slab[current[0] + 3 * un, current[1] + 3 * ue]):
+                    continue
+            if visited.test_and_set(nn, ne):
+                continue
+            branch[(nn, ne)] = current
+            hn = nn - goal_2d[0]
+            he = ne - goal_2d[1]
+            new_cost = current_cost + step_cost + (hn * hn + he * he) ** 0.5
+            queue.put((new_cost, (nn, ne)))
+            if goal_2d[0] - 2 <= nn <= goal_2d[0] + 2 and goal_2d[1] - 2 <= ne <= goal_2d[1] + 2:
+                branch[goal_2d] = current
+                path_2d = reconstruct_path(goal_2d, branch, lambda cell: cell)
+                path = np.empty((len(path_2d), 3), dtype=np.int32)
+                path[:, :2] = path_2d
+                path[:, 2] = flight_altitude
+                path[0, 2] = start[2]
+                path[-1, 2] = goal[2]
+                return new_cost, convert_25d_3d(path)
+    return None
+
+
+def _find_meet(cell, other_visited, tolerance=2):
+    """
+    Return the cell of the opposite frontier within the meet tolerance
+    of the given cell, or None. The tolerance mirrors the goal box of the
+    single-source search: frontiers stepping by 4 from misaligned origins
+    never land on identical cells.
+    """
+    for dn in range(-tolerance, tolerance + 1):
+        for de in range(-tolerance, tolerance + 1):
+            if other_visited.test(cell[0] + dn, cell[1] + de):
+                return (cell[0] + dn, cell[1] + de)
+    return None
+
+
+def _bidirectional_search(grid, h, start, goal, flight_altitude, waypoint_fn, clearance=None):
+    """
+    Grow two frontiers, one from the start (heuristic towards the goal)
+    and one from the goal (heuristic towards the start), always advancing
+    the one with the cheaper head. As soon as a new node lands within the
+    meet tolerance of a cell the other side has visited, the two parent
+    chains are spliced into the final plan.
+    """
+    start_2d = waypoint_fn(start)
+    goal_2d = waypoint_fn(goal)
+
+    # index 0 is the forward search, index 1 the backward one
+    queues = (BucketQueue(), BucketQueue())
+    visited = (CellBitmap(grid.shape), CellBitmap(grid.shape))
+    visited[0].test_and_set(start_2d[0], start_2d[1])
+    visited[1].test_and_set(goal_2d[0], goal_2d[1])
+    branches = ({start_2d: None}, {goal_2d: None})
+    targets = (goal, start)
+    queues[0].put((0, start))
+    queues[1].put((0, goal))
+
+    if _find_meet(start_2d, visited[1]) is not None:
+        return 0, np.array([start, goal], dtype=np.int32)
+
+    grid = np.ascontiguousarray(grid)
+    clearance = NO_CLEARANCE if clearance is None else clearance
+    nodes = np.empty((BATCH_SIZE, 3), dtype=np.int64)
+    coords = np.empty((BATCH_SIZE * len(ACTION_DELTAS), 3), dtype=np.int64)
+    costs = np.empty(BATCH_SIZE * len(ACTION_DELTAS), dtype=np.float64)
+    parents = np.empty(BATCH_SIZE * len(ACTION_DELTAS), dtype=np.int64)
+    while not queues[0].empty() and not queues[1].empty():
+        side = 0 if queues[0].peek_priority() <= queues[1].peek_priority() else 1
+        other = 1 - side
+        target = targets[side]
+        batch = queues[side].get_bucket(BATCH_SIZE)
+        _prefetch_frontier(grid, clearance, queues[side].peek_pending(BATCH_SIZE), ACTION_DELTAS)
+        for k, (_, node) in enumerate(batch):
+            nodes[k, 0], nodes[k, 1], nodes[k, 2] = node
+        total = _expand_batch(grid, clearance, nodes[:len(batch)],
+                              target[0], target[1], target[2], flight_altitude,
+                              ACTION_DELTAS, coords, costs, parents)
+        for i in range(total):
+            new_node = (int(coords[i, 0]), int(coords[i, 1]), int(coords[i, 2]))
+
+            if visited[side].test_and_set(new_node[0], new_node[1]):
+                continue
+            new_node_2d = waypoint_fn(new_node)
+            current_cost, current_node = batch[parents[i]]
+            branches[side][new_node_2d] = current_node
+            new_cost = current_cost + costs[i]
+            queues[side].put((new_cost, new_node))
+
+            meet_2d = _find_meet(new_node_2d, visited[other])
+            if meet_2d is not None:
+                meet_node = (meet_2d[0], meet_2d[1], new_node[2])
+                own_half = reconstruct_path(new_node, branches[side], waypoint_fn)
+                other_half = reconstruct_path(meet_node, branches[other], waypoint_fn)
+                if side == 0:
+                    return new_cost, np.vstack((own_half, other_half[::-1]))
+                return new_cost, np.vstack((other_half, own_half[::-1]))
+    return None
+
+
+def a_star(grid, h, start, goal, flight_altitude, waypoint_fn=lambda n: tuple(n[:2]), bidirectional=False,
+           clearance=None, planar=True):
+    """
+    2.5D A* search.
+    h is accepted for signature compatibility only: the heuristic is
+    inlined (as euclidean distance) in the expansion kernel.
+    With planar=True (the default) a 2D search over the obstacle slab at
+    the flying altitude is tried first and the full 2.5D machinery only
+    runs when that fails (e.g. a rooftop start or goal). With
+    bidirectional=True the 2.5D search is run from both ends at once and
+    stops when the frontiers meet, which expands far fewer nodes than a
+    single-source search on long routes.
     """
     t0 = time.time()
+    if planar:
+        planar_plan = _planar_search(_planar_slab(grid, flight_altitude), start, goal, flight_altitude)
+        if planar_plan is not None:
+            print("Found a plan. Total cost: {}, time cost: {}".format(planar_plan[0], time.time() - t0))
+            return planar_plan[1]
+
     start_2d = waypoint_fn(start)
     goal_2d = waypoint_fn(goal)
 
     final_plan = None
-    visited = set()
-    queue = PriorityQueue()
+    visited = CellBitmap(grid.shape)
+    queue = BucketQueue()
 
     queue.put((0, start))
-    visited.add(start_2d)
+    visited.test_and_set(start_2d[0], start_2d[1])
     branch = {start_2d: None}
     found = False
+
+    if bidirectional:
+        final_plan = _bidirectional_search(grid, h, start, goal, flight_altitude, waypoint_fn, clearance)
+        found = final_plan is not None
+
+    grid = np.ascontiguousarray(grid)
+    clearance = NO_CLEARANCE if clearance is None else clearance
+    nodes = np.empty((BATCH_SIZE, 3), dtype=np.int64)
+    coords = np.empty((BATCH_SIZE * len(ACTION_DELTAS), 3), dtype=np.int64)
+    costs = np.empty(BATCH_SIZE * len(ACTION_DELTAS), dtype=np.float64)
+    parents = np.empty(BATCH_SIZE * len(ACTION_DELTAS), dtype=np.int64)
     while not queue.empty() and not found:
-        current_cost, current_node = queue.get()
-        for alt_cost, action in valid_actions(grid, current_node):
+        batch = queue.get_bucket(BATCH_SIZE)
+        _prefetch_frontier(grid, clearance, queue.peek_pending(BATCH_SIZE), ACTION_DELTAS)
+        for k, (_, node) in enumerate(batch):
+            nodes[k, 0], nodes[k, 1], nodes[k, 2] = node
+        total = _expand_batch(grid, clearance, nodes[:len(batch)],
+                              goal[0], goal[1], goal[2], flight_altitude,
+                              ACTION_DELTAS, coords, costs, parents)
+        for i in range(total):
             if found:
                 break
 
-            cost = action.cost + alt_cost
-            next_node = tuple(map(op.add, waypoint_fn(current_node), action.delta))
-            lowest_alt = int(np.ceil(max(np.ceil(grid[next_node]) + 1, flight_altitude)))
-            new_node = (next_node + (lowest_alt,))
+            new_node = (int(coords[i, 0]), int(coords[i, 1]), int(coords[i, 2]))
 
-            new_node_2d = waypoint_fn(new_node)
-            if new_node_2d not in visited:
-                new_cost = current_cost + cost + h(new_node, goal)
+            if not visited.test_and_set(new_node[0], new_node[1]):
+                new_node_2d = waypoint_fn(new_node)
+                current_cost, current_node = batch[parents[i]]
+                new_cost = current_cost + costs[i]
                 branch[new_node_2d] = current_node
-                visited.add(new_node_2d)
                 queue.put((new_cost, new_node))
                 if goal_2d[0] - 2 <= new_node_2d[0] <= goal_2d[0] + 2 and \
                         goal_2d[1] - 2 <= new_node_2d[1] <= goal_2d[1] + 2:
@@ -194,6 +602,7 @@ def convert_25d_3d(path):
     """
     Convert plan in 2.5D to 3D grid map
     """
+    path = np.asarray(path)
     path_3d = [path[0]]
     previous = path[0]
     for i in range(1, len(path)):
@@ -204,7 +613,7 @@ def convert_25d_3d(path):
             path_3d.append((previous[0], previous[1], current[2]))
         path_3d.append(current)
         previous = current
-    return path_3d
+    return np.array(path_3d, dtype=path.dtype)
 
 
 def pickup_goal(grid, start, callback):
@@ -223,16 +632,77 @@ def pickup_goal(grid, start, callback):
     plt.show()
 
 
-def path_simplify(grid, path):
+@njit(cache=True, nogil=True, boundscheck=False)
+def _line_clear(grid, clearance, n1, e1, n2, e2, min_height):
+    """
+    Walk the line between two cells and report whether every cell on it
+    stays below min_height. With a clearance field the walk jumps ahead
+    by the clearance radius: cells within it are free at the flight
+    altitude, hence also below min_height.
+    """
+    steps = max(abs(n2 - n1), abs(e2 - e1))
+    if steps == 0:
+        return grid[n1, e1] < min_height
+    use_clearance = clearance.shape[0] != 0
+    dn = (n2 - n1) / steps
+    de = (e2 - e1) / steps
+    # one DDA step covers up to sqrt(2) cells on a diagonal, so a jump
+    # of k steps spans k * step_len cells: divide the clearance radius
+    # by the step length or the walk overshoots the safe disc
+    step_len = np.sqrt(dn * dn + de * de)
+    t = 0.0
+    while t <= steps:
+        n = int(round(n1 + dn * t))
+        e = int(round(e1 + de * t))
+        if grid[n, e] >= min_height:
+            return False
+        if use_clearance:
+            t += max(1.0, (clearance[n, e] - 1.0) / step_len)
+        else:
+            t += 1.0
+    return grid[n2, e2] < min_height
+
+
+def los_simplify(grid, path, clearance=None):
+    """
+    Collapse the path onto the farthest directly-visible waypoints in a
+    single greedy sweep. Collinear interior points are trivially visible,
+    so this subsumes the separate path_prune + path_simplify passes.
+    """
+    path = np.asarray(path)
+    if len(path) <= 2:
+        return path.copy()
+    grid = np.ascontiguousarray(grid)
+    clearance = NO_CLEARANCE if clearance is None else clearance
+    keep = [0]
+    i = 0
+    last = len(path) - 1
+    while i < last:
+        j = last
+        while j > i + 1:
+            a, b = path[i], path[j]
+            if _line_clear(grid, clearance, int(a[0]), int(a[1]), int(b[0]), int(b[1]),
+                           float(min(a[2], b[2]))):
+                break
+            j -= 1
+        keep.append(j)
+        i = j
+    return path[keep]
+
+
+def path_simplify(grid, path, clearance=None):
     """
     Test many nodes and find the longest possible direct path between them.
+    When a clearance field is given, the line-of-sight walk jumps ahead by
+    the clearance at each cell instead of testing every cell on the line.
     """
+    path = np.asarray(path)
     if len(path) <= 2:
         return path
     print("Simplifying path:", path)
     start_idx = 0
     end_idx = len(path) - 1
-    result_path = [path[0]]
+    keep = [0]
     while start_idx < end_idx:
         start = path[start_idx]
         end = path[end_idx]
@@ -240,22 +710,31 @@ def path_simplify(grid, path):
         cells = bresenham(start, end)
 
         has_obs = False
-        for n, e in cells:
+        j = 0
+        while j < len(cells):
+            n, e = cells[j]
             if grid[n, e] >= min_height:
                 has_obs = True
                 break
+            if clearance is not None:
+                # every cell within the clearance radius is free at the
+                # flight altitude, and segment heights never drop below it
+                j += max(1, int(clearance[n, e]) - 1)
+            else:
+                j += 1
 
         if has_obs:
             end_idx -= 1
             if end_idx == start_idx:
                 print("No direct path! {}".format(path[start_idx]))
         else:
-            result_path.append(end)
+            keep.append(end_idx)
             start_idx = end_idx
             end_idx = len(path) - 1
-    if result_path[-1] != path[-1]:
-        result_path.append(path[-1])
+    if keep[-1] != len(path) - 1:
+        keep.append(len(path) - 1)
 
+    result_path = path[keep]
     print("Final path:", result_path)
     return result_path
 